@@ -1,10 +1,11 @@
 from bs4 import BeautifulSoup
-import requests
+import aiohttp
+import asyncio
 import pandas as pd
-import json
+import orjson
 import os
 import re
-from time import sleep
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # ---------------- CONFIG ----------------
 CSV_FILE = "../mftplus_courses.csv"
@@ -12,11 +13,26 @@ OUTPUT_JSON = "courses_full_data.json"
 OUTPUT_FOLDER = "course_fields"
 LINK_COLUMN = "course_url"
 LESSON_ID_REGEX = r"/lesson/(\d+)/"
+LESSON_ID_RE = re.compile(LESSON_ID_REGEX)
+
+MAX_CONCURRENCY = 10
+CLEAN_WORKERS = os.cpu_count() or 1
+WRITE_WORKERS = 16
+QUEUE_SIZE = 64
+REQUEST_TIMEOUT = 20
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0"
 }
 
+# h2 heading keyword -> field its following <ul class="custom-ul"> fills
+SECTION_KEYWORDS = {
+    "پیش نیاز": "prerequisites",
+    "سرفصل": "curriculum",
+    "کسب توانایی": "skills_acquired",
+    "بازار کار": "career_opportunities"
+}
+
 FIELDS = [
     "description",
     "prerequisites",
@@ -27,7 +43,7 @@ FIELDS = [
 
 # ---------------- EXTRACT LESSON ID ----------------
 def extract_lesson_id(url):
-    match = re.search(LESSON_ID_REGEX, url)
+    match = LESSON_ID_RE.search(url)
     return match.group(1) if match else None
 
 # ---------------- GET UNIQUE URLS ----------------
@@ -42,26 +58,17 @@ def extract_unique_urls_by_lessonid(csv_file):
         print(f"❌ Column '{LINK_COLUMN}' not found in CSV")
         return []
 
-    unique_ids = set()
-    urls = []
-
-    for link in df[LINK_COLUMN].dropna():
-        link = link.strip()
-        lesson_id = extract_lesson_id(link)
-        if not lesson_id:
-            continue
-        if lesson_id in unique_ids:
-            continue
+    links = df[LINK_COLUMN].dropna().str.strip()
+    lesson_ids = links.str.extract(LESSON_ID_RE, expand=False)
+    mask = lesson_ids.notna() & ~lesson_ids.duplicated()
 
-        unique_ids.add(lesson_id)
-        urls.append(link)
-
-    return urls
+    return links[mask].tolist()
 
 # ---------------- SCRAPE COURSE PAGE ----------------
-def scrape_course(url):
-    response = requests.get(url, headers=HEADERS, timeout=20)
-    soup = BeautifulSoup(response.text, "html.parser")
+async def scrape_course(session, url):
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+        content = await response.read()
+    soup = BeautifulSoup(content, "lxml")
 
     lesson_id = extract_lesson_id(url)
 
@@ -71,43 +78,39 @@ def scrape_course(url):
     desc_tag = soup.select_one("div.forced-ellipsis p")
     description = desc_tag.get_text(" ", strip=True) if desc_tag else ""
 
-    prerequisites = []
-    curriculum = []
-    skills_acquired = []
-    career_opportunities = []
+    sections = {field: [] for field in SECTION_KEYWORDS.values()}
+    seen_headings = set()
 
-    for h2 in soup.find_all("h2"):
-        text = h2.get_text(strip=True)
-        ul = h2.find_next("ul", class_="custom-ul")
-        if not ul:
+    for ul in soup.select("ul.custom-ul"):
+        h2 = ul.find_previous("h2")
+        # only the first list after a heading belongs to its section
+        if not h2 or id(h2) in seen_headings:
             continue
+        seen_headings.add(id(h2))
 
-        items = [li.get_text(" ", strip=True) for li in ul.find_all("li")]
+        text = h2.get_text(strip=True)
+        items = [li.get_text(" ", strip=True) for li in ul.select("li")]
 
-        if "پیش نیاز" in text:
-            prerequisites = items
-        elif "سرفصل" in text:
-            curriculum = items
-        elif "کسب توانایی" in text:
-            skills_acquired = items
-        elif "بازار کار" in text:
-            career_opportunities = items
+        for keyword, field in SECTION_KEYWORDS.items():
+            if keyword in text:
+                sections[field] = items
+                break
 
     return {
         "lesson_id": lesson_id,
         "title": title,
         "description": description,
-        "prerequisites": prerequisites,
-        "curriculum": curriculum,
-        "skills_acquired": skills_acquired,
-        "career_opportunities": career_opportunities,
+        **sections,
         "url": url
     }
 
 # ---------------- CLEANING ----------------
-INVISIBLE_CHARS = re.compile(r"[\u200e\u200f]")
-UNICODE_CLEAN = re.compile(r"[^\w\s\.,;:!?()؟،\-–—'\"/]+")
+# drop LRM/RLM marks and fold tabs to spaces
+INVIS_TABLE = {0x200e: None, 0x200f: None, 0x09: 0x20}
+JUNK_CHARS = re.compile(r"[^\w\s\.,;:!?()؟،\-–—'\"/]+")
+# applied after JUNK_CHARS so dash runs split by removed symbols are caught too
 MULTI_DASH = re.compile(r"-{3,}")
+WHITESPACE_RE = re.compile(r"\s+")
 NOISE_REGEX = re.compile(
     r"""
     ^\s*$ |
@@ -121,11 +124,9 @@ NOISE_REGEX = re.compile(
 def normalize_string(text):
     if text is None:
         return None
-    text = INVISIBLE_CHARS.sub("", text)
-    text = UNICODE_CLEAN.sub("", text)
-    text = text.replace("\t", " ")
-    text = MULTI_DASH.sub("", text)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = text.translate(INVIS_TABLE)
+    text = MULTI_DASH.sub("", JUNK_CHARS.sub("", text))
+    text = WHITESPACE_RE.sub(" ", text).strip()
     if not text or NOISE_REGEX.search(text):
         return None
     return text
@@ -133,7 +134,7 @@ def normalize_string(text):
 def clean_list(lst):
     if not lst or not isinstance(lst, list):
         return None
-    cleaned = [normalize_string(item) for item in lst if normalize_string(item)]
+    cleaned = [n for item in lst if (n := normalize_string(item))]
     return cleaned or None
 
 def clean_object(obj):
@@ -147,58 +148,116 @@ def clean_object(obj):
     return cleaned
 
 # ---------------- SAVE EACH FIELD SEPARATELY ----------------
-def save_fields_separately(data, output_folder=OUTPUT_FOLDER):
+def make_field_folders(output_folder=OUTPUT_FOLDER):
     os.makedirs(output_folder, exist_ok=True)
 
     # create subfolders for each field
     for field in FIELDS:
         os.makedirs(os.path.join(output_folder, field), exist_ok=True)
 
-    for course in data:
-        lesson_id = course.get("lesson_id")
-        if not lesson_id:
+def course_field_files(course, output_folder=OUTPUT_FOLDER):
+    lesson_id = course.get("lesson_id")
+    if not lesson_id:
+        return []
+
+    files = []
+    for field in FIELDS:
+        content = course.get(field)
+        if content is None:
+            continue
+        path = os.path.join(output_folder, field, f"{lesson_id}.txt")
+        # join list items if needed
+        if isinstance(content, list):
+            content = "\n".join(content)
+        files.append((path, content))
+    return files
+
+def _write_one(path_content):
+    path, content = path_content
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+# ---------------- PIPELINE ----------------
+# fetch -> clean -> write, joined by bounded queues and stopped with None sentinels
+async def fetch_stage(session, url_q, fetch_q, total):
+    while (item := await url_q.get()) is not None:
+        i, url = item
+        try:
+            data = await scrape_course(session, url)
+        except Exception as e:
+            print(f"❌ Error scraping {url}:", e)
             continue
-        for field in FIELDS:
-            content = course.get(field)
-            if content is None:
-                continue
-            path = os.path.join(output_folder, field, f"{lesson_id}.txt")
-            # join list items if needed
-            if isinstance(content, list):
-                content = "\n".join(content)
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(content)
-
-    print(f"✅ Saved each field into folders under '{output_folder}'")
+        print(f"📘 [{i}/{total}] Scraped: {url}")
+        await fetch_q.put((i, data))
+
+async def clean_stage(clean_pool, fetch_q, clean_q):
+    loop = asyncio.get_running_loop()
+    while (item := await fetch_q.get()) is not None:
+        i, data = item
+        await clean_q.put((i, await loop.run_in_executor(clean_pool, clean_object, data)))
+
+async def write_stage(write_pool, clean_q, cleaned):
+    loop = asyncio.get_running_loop()
+    while (item := await clean_q.get()) is not None:
+        cleaned.append(item)
+        # overlap the open/write/close syscalls of the course's small files
+        await asyncio.gather(*(
+            loop.run_in_executor(write_pool, _write_one, path_content)
+            for path_content in course_field_files(item[1])
+        ))
+
+async def close_stage(upstream, q, consumers):
+    # once every producer has finished, send one sentinel per downstream consumer
+    await asyncio.wait(upstream)
+    for _ in range(consumers):
+        await q.put(None)
+
+async def run_pipeline(urls):
+    url_q = asyncio.Queue()
+    fetch_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+    clean_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    for item in enumerate(urls, 1):
+        url_q.put_nowait(item)
+    for _ in range(MAX_CONCURRENCY):
+        url_q.put_nowait(None)
+
+    make_field_folders()
+    cleaned = []
+
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY)
+    with ProcessPoolExecutor(CLEAN_WORKERS) as clean_pool, ThreadPoolExecutor(WRITE_WORKERS) as write_pool:
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector) as session:
+            # one group, so a failing stage cancels the others instead of leaving them blocked on a full queue
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    fetchers = [tg.create_task(fetch_stage(session, url_q, fetch_q, len(urls))) for _ in range(MAX_CONCURRENCY)]
+                    cleaners = [tg.create_task(clean_stage(clean_pool, fetch_q, clean_q)) for _ in range(CLEAN_WORKERS)]
+                    tg.create_task(write_stage(write_pool, clean_q, cleaned))
+                    tg.create_task(close_stage(fetchers, fetch_q, len(cleaners)))
+                    tg.create_task(close_stage(cleaners, clean_q, 1))
+            except ExceptionGroup as eg:
+                raise eg.exceptions[0]
+
+    print(f"✅ Saved each field into folders under '{OUTPUT_FOLDER}'")
+
+    # keep the CSV's URL order in the JSON dump
+    cleaned.sort(key=lambda item: item[0])
+    return [course for _, course in cleaned]
 
 # ---------------- MAIN ----------------
 def main():
     urls = extract_unique_urls_by_lessonid(CSV_FILE)
     print(f"🔗 {len(urls)} unique URLs found")
 
-    results = []
-
-    for i, url in enumerate(urls, 1):
-        print(f"📘 [{i}/{len(urls)}] Scraping: {url}")
-        try:
-            data = scrape_course(url)
-            results.append(data)
-            sleep(1)
-        except Exception as e:
-            print(f"❌ Error scraping {url}:", e)
-
-    # clean data
-    cleaned = [clean_object(item) for item in results]
+    cleaned = asyncio.run(run_pipeline(urls))
 
     # save full cleaned JSON
-    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(cleaned, f, ensure_ascii=False, indent=2)
+    with open(OUTPUT_JSON, "wb") as f:
+        f.write(orjson.dumps(cleaned, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
     print(f"\n✅ Saved {len(cleaned)} courses to {OUTPUT_JSON}")
 
-    # save each field into separate folder
-    save_fields_separately(cleaned)
-
 # ---------------- RUN ----------------
 if __name__ == "__main__":
     main()
\ No newline at end of file
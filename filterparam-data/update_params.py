@@ -1,4 +1,6 @@
-import json
+import aiohttp
+import asyncio
+import orjson
 import requests
 from datetime import datetime
 from zoneinfo import ZoneInfo
@@ -9,7 +11,15 @@ HEADERS = {
     "X-Requested-With": "XMLHttpRequest",
     "User-Agent": "Mozilla/5.0"
 }
+FORM_HEADERS = {
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"
+}
 TIMEZONE = ZoneInfo("Asia/Tehran")
+MAX_CONCURRENCY = 10
+
+# one pooled keep-alive connection for every request
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
 
 PATH_PLACES = "places.json"
 PATH_DEPARTMENTS = "departments.json"
@@ -21,7 +31,7 @@ PATH_MONTHS = "months.json"
 def fetch_json(need: str):
     """Fetch JSON data from mftplus calendar API"""
     url = f"{BASE_URL}?need={need}"
-    r = requests.post(url, headers=HEADERS, timeout=30)
+    r = SESSION.post(url, timeout=30)
     r.raise_for_status()
     return r.json()
 
@@ -61,8 +71,8 @@ def now_tehran():
 
 
 def save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 # ================== Places ==================
 places_raw = fetch_json("place")
@@ -112,17 +122,14 @@ print(f"✔ Saved {len(dataset_months)} months to {PATH_MONTHS}")
 
 # ================== Groups ==================
 
-def fetch_groups_by_department(department_id: str):
+async def fetch_groups_by_department(session, sem, department_id: str):
     url = f"{BASE_URL}?need=group"
     payload = {
         "ids[]": department_id
     }
-    r = requests.post(url, headers={
-        **HEADERS,
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"
-    }, data=payload, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    async with sem, session.post(url, headers=FORM_HEADERS, data=payload) as r:
+        r.raise_for_status()
+        return orjson.loads(await r.read())
 
 
 def extract_oid(item):
@@ -133,83 +140,107 @@ def extract_oid(item):
         return raw_id
     raise ValueError(f"Unknown id format: {item}")
 
-active_departments = [d for d in departments if d.get("active") == 1]
 
-now = now_tehran()
-groups = []
+async def fetch_groups(session, sem):
+    active_departments = [d for d in departments if d.get("active") == 1]
+
+    for dept in active_departments:
+        print(f"▶ Fetching groups for department: {dept['title']}")
 
-for dept in active_departments:
-    dept_id = dept["id"]
-    dept_title = dept["title"]
+    groups_raws = await asyncio.gather(*(
+        fetch_groups_by_department(session, sem, dept["id"]) for dept in active_departments
+    ))
 
-    print(f"▶ Fetching groups for department: {dept_title}")
+    now = now_tehran()
+    groups = []
 
-    groups_raw = fetch_groups_by_department(dept_id)
-    group_items = normalize_list(groups_raw)
+    for dept, groups_raw in zip(active_departments, groups_raws):
+        dept_id = dept["id"]
+        dept_title = dept["title"]
 
-    for g in group_items:
-        group_id = extract_oid(g)
+        group_items = normalize_list(groups_raw)
 
-        groups.append({
-            "id": group_id,
-            "title": g.get("title"),
-            "department_id": dept_id,
-            "department_title": dept_title,
-            "active": 1,
-            "first_seen": now,
-            "last_seen": now,
-            "last_state_change": now
-        })
+        for g in group_items:
+            group_id = extract_oid(g)
 
-save_json(PATH_GROUPS, groups)
-print(f"✔ Saved {len(groups)} groups to {PATH_GROUPS}")
+            groups.append({
+                "id": group_id,
+                "title": g.get("title"),
+                "department_id": dept_id,
+                "department_title": dept_title,
+                "active": 1,
+                "first_seen": now,
+                "last_seen": now,
+                "last_state_change": now
+            })
+
+    return groups
 
 # ================== Courses ==================
 
-def fetch_courses_by_group(group_id: str):
+async def fetch_courses_by_group(session, sem, group_id: str):
     url = f"{BASE_URL}?need=course"
     payload = {
         "ids[]": group_id
     }
-    r = requests.post(url, headers={
-        **HEADERS,
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"
-    }, data=payload, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    async with sem, session.post(url, headers=FORM_HEADERS, data=payload) as r:
+        r.raise_for_status()
+        return orjson.loads(await r.read())
 
 
-active_groups = [g for g in groups if g.get("active") == 1]
+async def fetch_courses(session, sem, groups):
+    active_groups = [g for g in groups if g.get("active") == 1]
 
-now = now_tehran()
-courses = []
-
-for grp in active_groups:
-    group_id = grp["id"]
-    group_title = grp["title"]
-    dept_id = grp["department_id"]
-    dept_title = grp["department_title"]
-
-    print(f"▶ Fetching courses for group: {group_title} (Department: {dept_title})")
-
-    courses_raw = fetch_courses_by_group(group_id)
-    course_items = normalize_list(courses_raw)
-
-    for c in course_items:
-        course_id = extract_oid(c)
-
-        courses.append({
-            "id": course_id,
-            "title": c.get("title"),
-            "group_id": group_id,
-            "group_title": group_title,
-            "department_id": dept_id,
-            "department_title": dept_title,
-            "active": 1,
-            "first_seen": now,
-            "last_seen": now,
-            "last_state_change": now
-        })
-
-save_json(PATH_COURSES, courses)
-print(f"✔ Saved {len(courses)} courses to {PATH_COURSES}")
+    for grp in active_groups:
+        print(f"▶ Fetching courses for group: {grp['title']} (Department: {grp['department_title']})")
+
+    courses_raws = await asyncio.gather(*(
+        fetch_courses_by_group(session, sem, grp["id"]) for grp in active_groups
+    ))
+
+    now = now_tehran()
+    courses = []
+
+    for grp, courses_raw in zip(active_groups, courses_raws):
+        group_id = grp["id"]
+        group_title = grp["title"]
+        dept_id = grp["department_id"]
+        dept_title = grp["department_title"]
+
+        course_items = normalize_list(courses_raw)
+
+        for c in course_items:
+            course_id = extract_oid(c)
+
+            courses.append({
+                "id": course_id,
+                "title": c.get("title"),
+                "group_id": group_id,
+                "group_title": group_title,
+                "department_id": dept_id,
+                "department_title": dept_title,
+                "active": 1,
+                "first_seen": now,
+                "last_seen": now,
+                "last_state_change": now
+            })
+
+    return courses
+
+# ================== Run groups & courses ==================
+
+async def main():
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=30)
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+        groups = await fetch_groups(session, sem)
+        save_json(PATH_GROUPS, groups)
+        print(f"✔ Saved {len(groups)} groups to {PATH_GROUPS}")
+
+        courses = await fetch_courses(session, sem, groups)
+        save_json(PATH_COURSES, courses)
+        print(f"✔ Saved {len(courses)} courses to {PATH_COURSES}")
+
+
+asyncio.run(main())
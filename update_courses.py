@@ -1,10 +1,12 @@
 import aiohttp
 import asyncio
 import pandas as pd
-import json
+import orjson
 import os
+import hashlib
 import argparse
 from urllib.parse import quote
+from functools import lru_cache
 import jdatetime
 import re
 from pandas.errors import EmptyDataError
@@ -15,8 +17,12 @@ API_URL = "https://mftplus.com/ajax/default/calendar?need=search"
 PAGE_SIZE = 9
 MAX_CONCURRENCY = 5
 MAX_EMPTY_PAGES = 2
+MAX_RETRIES = 3
+DEFAULT_RETRY_AFTER = 1
 
 CSV_FILE = "mftplus_courses.csv"
+PARQUET_FILE = "mftplus_courses.parquet"
+STATE_FILE = "mftplus_courses.state"
 JSON_FILE = "mftplus_courses.json"
 LOG_FILE = "COURSE_LOG.md"
 
@@ -28,6 +34,10 @@ COLUMNS = [
     "course_url", "cover", "certificate",
     "is_active", "changed_at", "updated_at"
 ]
+# stored as nullable Int64 / category; is_active is bool and every other column is text
+# (class_id and lesson_id included, so ids the API sends as non-numeric text survive)
+INT_COLUMNS = ["capacity", "duration_hours", "min_price", "max_price"]
+CATEGORY_COLUMNS = ["department", "center", "teacher", "days"]
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0",
@@ -37,12 +47,18 @@ HEADERS = {
 }
 
 FA_TO_EN = str.maketrans("۰۱۲۳۴۵۶۷۸۹", "0123456789")
+# FA_TO_EN plus dropping thousands separators, for prices
+PRICE_TABLE = str.maketrans({**dict(zip("۰۱۲۳۴۵۶۷۸۹", "0123456789")), ",": None})
 MONTHS_FA = {
     "فروردین": 1, "اردیبهشت": 2, "خرداد": 3,
     "تیر": 4, "مرداد": 5, "شهریور": 6,
     "مهر": 7, "آبان": 8, "آذر": 9,
     "دی": 10, "بهمن": 11, "اسفند": 12
 }
+# author values the API uses for "no teacher assigned"
+TEACHER_BLANKS = frozenset(("مشخص نشده", "", None))
+SEASONS_FA = {0: "بهار", 1: "تابستان", 2: "پاییز", 3: "زمستان"}
+JALALI_DATE_RE = re.compile(r"(?P<day>\d{1,2}) (?P<month_fa>\S+) (?P<year>\d{4})")
 
 # ---------------- HELPERS ----------------
 def fa_to_en_func(val):
@@ -53,7 +69,7 @@ def fa_to_en_func(val):
 def normalize_price(val):
     if not val or pd.isna(val):
         return None
-    val = fa_to_en_func(val).replace(",", "")
+    val = str(val).translate(PRICE_TABLE)
     return int(val) if val.isdigit() else None
 
 def normalize_bool(val):
@@ -62,163 +78,219 @@ def normalize_bool(val):
     except:
         return False
 
+def normalize_bools(values):
+    """normalize_bool over a Series, evaluated once per distinct value"""
+    lookup = {v: normalize_bool(v) for v in pd.unique(values)}
+    return values.map(lookup).fillna(False).astype(bool)
+
 def now_jalali():
     j = jdatetime.datetime.now()
     return f"{j.year:04d}-{j.month:02d}-{j.day:02d}"
 
-def normalize_jalali_date(text):
-    if not text or pd.isna(text):
-        return None
-    text = fa_to_en_func(text)
-    match = re.search(r"(\d{1,2}) (\w+) (\d{4})", text)
-    if not match:
-        return None
-    day, month_fa, year = match.groups()
-    month = MONTHS_FA.get(month_fa)
-    if not month:
-        return None
-    jd = jdatetime.date(int(year), month, int(day))
+@lru_cache(maxsize=4096)
+def format_jalali_date(year, month, day):
+    jd = jdatetime.date(year, month, day)
     return f"{jd.year:04d}-{jd.month:02d}-{jd.day:02d}"
 
-def get_season_from_jalali(date_str):
-    if not date_str:
-        return None
-    try:
-        month = int(date_str.split("-")[1])
-    except:
-        return None
-    if 1 <= month <= 3:
-        return "بهار"
-    if 4 <= month <= 6:
-        return "تابستان"
-    if 7 <= month <= 9:
-        return "پاییز"
-    if 10 <= month <= 12:
-        return "زمستان"
-    return None
+def normalize_jalali_dates(texts):
+    """Parse a Series of API dates like '۶ اسفند ۱۴۰۴' into 'YYYY-MM-DD' (None if unparsable)"""
+    parts = texts.astype("string").str.translate(FA_TO_EN).str.extract(JALALI_DATE_RE)
+    parts["month"] = parts["month_fa"].map(MONTHS_FA)
+    keys = ["year", "month", "day"]
+    # build each distinct date once, then join it back onto every row
+    unique = parts[keys].dropna().drop_duplicates()
+    unique["date"] = [format_jalali_date(int(y), int(m), int(d)) for y, m, d in unique.itertuples(index=False)]
+    dates = parts[keys].merge(unique, on=keys, how="left")["date"]
+    return dates.set_axis(texts.index).astype(object).where(dates.notna().to_numpy(), None)
+
+def seasons_from_jalali(dates):
+    """Map a Series of 'YYYY-MM-DD' Jalali dates to their season name"""
+    month = pd.to_numeric(dates.str[5:7], errors="coerce")
+    return ((month - 1) // 3).map(SEASONS_FA).astype(object).where(month.between(1, 12), None)
 
 def make_course_link(course):
     return f"https://mftplus.com/lesson/{course.get('lessonId','')}/{course.get('lessonUrl','')}?refp={quote(course.get('center',''))}"
 
-def normalize_course(course, is_active, changed_at):
-    now = now_jalali()
-    start_date = normalize_jalali_date(course.get("start"))
+def _course_fields(course, is_active, changed_at, now):
+    """Per-course values; dates stay raw API text under start_raw/end_raw for normalize_courses to parse"""
+    g = course.get
+    capacity, time, author = g("capacity"), g("time"), g("author")
     return {
         "id": course["id"]["$oid"],
-        "class_id": course.get("number",""),
-        "lesson_id": course.get("lessonId",""),
-        "title": course.get("title",""),
-        "department": course.get("dep",""),
-        "center": course.get("center",""),
-        "teacher": None if course.get("author") in ["مشخص نشده","",None] else course.get("author"),
-        "start_date": start_date,
-        "end_date": normalize_jalali_date(course.get("end")),
-        "season": get_season_from_jalali(start_date),
-        "capacity": int(fa_to_en_func(course.get("capacity"))) if course.get("capacity") not in [None,""] else None,
-        "duration_hours": int(fa_to_en_func(course.get("time"))) if course.get("time") not in [None,""] else None,
-        "days": " | ".join(course.get("days",[])),
-        "min_price": normalize_price(course.get("minCost")),
-        "max_price": normalize_price(course.get("maxCost")),
+        "class_id": g("number",""),
+        "lesson_id": g("lessonId",""),
+        "title": g("title",""),
+        "department": g("dep",""),
+        "center": g("center",""),
+        "teacher": None if author in TEACHER_BLANKS else author,
+        "start_raw": g("start"),
+        "end_raw": g("end"),
+        "capacity": int(fa_to_en_func(capacity)) if capacity not in (None,"") else None,
+        "duration_hours": int(fa_to_en_func(time)) if time not in (None,"") else None,
+        "days": " | ".join(g("days",[])),
+        "min_price": normalize_price(g("minCost")),
+        "max_price": normalize_price(g("maxCost")),
         "course_url": make_course_link(course),
-        "cover": course.get("cover",""),
-        "certificate": course.get("cer",""),
+        "cover": g("cover",""),
+        "certificate": g("cer",""),
         "is_active": normalize_bool(is_active), 
         "changed_at": changed_at,
         "updated_at": now
     }
 
+def normalize_courses(raw, now):
+    rows = [_course_fields(c,1,now,now) for c in raw]
+    # build column lists directly instead of letting pandas infer dtypes row by row;
+    # the date and season columns start empty and are filled from the raw text below
+    df = pd.DataFrame({col: [r.get(col) for r in rows] for col in COLUMNS})
+    df["start_date"] = normalize_jalali_dates(pd.Series([r["start_raw"] for r in rows], dtype=object))
+    df["end_date"] = normalize_jalali_dates(pd.Series([r["end_raw"] for r in rows], dtype=object))
+    df["season"] = seasons_from_jalali(df["start_date"])
+    return apply_dtypes(df)
+
 # ---------------- LOAD EXISTING ----------------
 def load_existing():
+    # the parquet file is the typed sync state; the CSV only seeds it on first run
+    if os.path.exists(PARQUET_FILE):
+        df = pd.read_parquet(PARQUET_FILE)
+        return df if not df.empty else pd.DataFrame(columns=COLUMNS)
     if not os.path.exists(CSV_FILE):
         return pd.DataFrame(columns=COLUMNS)
     try:
-        df = pd.read_csv(CSV_FILE)
+        df = pd.read_csv(CSV_FILE, dtype={c: "category" for c in CATEGORY_COLUMNS})
         return df if not df.empty else pd.DataFrame(columns=COLUMNS)
     except EmptyDataError:
         return pd.DataFrame(columns=COLUMNS)
 
 # ---------------- SAVE ----------------
+def apply_dtypes(df):
+    for col in COLUMNS:
+        if col in INT_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+        elif col in CATEGORY_COLUMNS:
+            df[col] = df[col].astype("category")
+        elif col == "is_active":
+            df[col] = df[col].astype(bool)
+        else:
+            df[col] = df[col].astype("string")
+    return df
+
+def content_digest(df):
+    # updated_at moves on every sync, so it is left out of the "did anything change" hash
+    hashes = pd.util.hash_pandas_object(df.drop(columns="updated_at"), index=False)
+    return hashlib.blake2b(hashes.to_numpy().tobytes(), digest_size=16).hexdigest()
+
+def load_saved_digest():
+    if not all(os.path.exists(p) for p in (STATE_FILE, PARQUET_FILE, CSV_FILE, JSON_FILE)):
+        return None
+    with open(STATE_FILE, encoding="utf-8") as f:
+        return f.read().strip()
+
 def save_all(df, new, expired, revived):
     for col in COLUMNS:
         if col not in df.columns:
             df[col] = None
-    df['is_active'] = df['is_active'].apply(lambda x: normalize_bool(x))
-    df.to_csv(CSV_FILE, index=False, encoding="utf-8-sig")
-    df.to_json(JSON_FILE, force_ascii=False, indent=2)
+    df['is_active'] = normalize_bools(df['is_active'])
+    df = apply_dtypes(df[COLUMNS].copy())
+    digest = content_digest(df)
+    if digest == load_saved_digest():
+        print("💤 No changes since last sync, nothing written")
+        return
+    df.to_parquet(PARQUET_FILE, index=False, compression="snappy")
+    df.to_csv(CSV_FILE, index=False, encoding="utf-8-sig", lineterminator="\n")
+    # same column-oriented layout as DataFrame.to_json, without pandas' encoder
+    with open(JSON_FILE, "wb") as f:
+        f.write(orjson.dumps(df.to_dict(), option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
     now = now_jalali()
+    parts = [f"\n<details><summary>📊 Sync {now} 📈({len(new)}) 📉({len(expired)}) ♻️({len(revived)})</summary>\n\n"]
+    for title, items in [("📈 New", new),("📉 Expired", expired),("♻️ Revived", revived)]:
+        if items:
+            parts.append(f"<details><summary>{title} ({len(items)})</summary>\n\n")
+            parts.extend(f"- [{c['title']}]({c['course_url']}) | {c['class_id']} | {c['id']} \n" for c in items)
+            parts.append("</details>\n")
+    parts.append("</details>\n")
     with open(LOG_FILE,"a",encoding="utf-8") as f:
-        f.write(f"\n<details><summary>📊 Sync {now} 📈({len(new)}) 📉({len(expired)}) ♻️({len(revived)})</summary>\n\n")
-        for title, items in [("📈 New", new),("📉 Expired", expired),("♻️ Revived", revived)]:
-            if items:
-                f.write(f"<details><summary>{title} ({len(items)})</summary>\n\n")
-                for c in items: f.write(f"- [{c['title']}]({c['course_url']}) | {c['class_id']} | {c['id']} \n")
-                f.write("</details>\n")
-        f.write("</details>\n")
+        f.write("".join(parts))
+    with open(STATE_FILE,"w",encoding="utf-8") as f:
+        f.write(digest)
 
 
 # ---------------- FETCH ----------------
-async def fetch_page(session, payload):
-    async with session.post(API_URL, data=payload) as r:
-        return json.loads(await r.text())
+async def fetch_page(session, sem, payload):
+    async with sem:
+        for attempt in range(MAX_RETRIES + 1):
+            async with session.post(API_URL, data=payload) as r:
+                if r.status != 429:
+                    return orjson.loads(await r.read())
+                if attempt == MAX_RETRIES:
+                    r.raise_for_status()
+                retry_after = r.headers.get("Retry-After", "")
+            # rate limited: wait as long as the server asks before retrying
+            await asyncio.sleep(int(retry_after) if retry_after.isdigit() else DEFAULT_RETRY_AFTER)
 
 async def fetch_all(payload):
-    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY, ttl_dns_cache=300, keepalive_timeout=60)
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
     skip, empty, data_all = 0, 0, []
     async with aiohttp.ClientSession(headers=HEADERS, connector=connector) as session:
-        while True:
-            payload["skip"] = skip
-            data = await fetch_page(session, payload)
-            if not data:
-                empty += 1
-                if empty >= MAX_EMPTY_PAGES: break
-            else:
-                empty = 0
-                data_all.extend(data)
-                print(f"✅ skip={skip} → {len(data)}")
-            skip += PAGE_SIZE
-            await asyncio.sleep(0.2)
+        # request MAX_CONCURRENCY pages at a time, then consume them in order
+        while empty < MAX_EMPTY_PAGES:
+            skips = range(skip, skip + MAX_CONCURRENCY * PAGE_SIZE, PAGE_SIZE)
+            pages = await asyncio.gather(*(fetch_page(session, sem, {**payload, "skip": s}) for s in skips))
+            for s, data in zip(skips, pages):
+                if not data:
+                    empty += 1
+                    if empty >= MAX_EMPTY_PAGES: break
+                else:
+                    empty = 0
+                    data_all.extend(data)
+                    print(f"✅ skip={s} → {len(data)}")
+            skip += MAX_CONCURRENCY * PAGE_SIZE
     return data_all
 
 # ---------------- SYNC ----------------
 async def sync(payload):
-    existing_df = load_existing()
     now = now_jalali()
-    existing_map = {str(r["id"]): r.to_dict() for _, r in existing_df.iterrows()}
-    old_active = {k for k,v in existing_map.items() if normalize_bool(v["is_active"])}
-    old_inactive = {k for k,v in existing_map.items() if not normalize_bool(v["is_active"])}
-
-    raw = await fetch_all(payload)
-    api_ids, api_courses = set(), []
-    for c in raw:
-        cid = c["id"]["$oid"]
-        api_ids.add(cid)
-        prev = existing_map.get(cid)
-        changed = not prev or not normalize_bool(prev["is_active"])
-        api_courses.append(normalize_course(c,1,now if changed else prev.get("changed_at", now)))
-
-    new = [c for c in api_courses if c["id"] not in existing_map]
-    revived = [c for c in api_courses if c["id"] in old_inactive]
-    expired = []
-    for cid in old_active - api_ids:
-        row = existing_map[cid]
-        row["is_active"] = False
-        row["changed_at"] = now
-        row["updated_at"] = now
-        expired.append(row)
-
-    final = {r["id"]:r for r in existing_map.values()}
-    for c in api_courses + expired: final[c["id"]] = c
-    save_all(pd.DataFrame(final.values(),columns=COLUMNS),new,expired,revived)
+    # read the saved state in a worker thread while the pages are fetched
+    existing_df, raw = await asyncio.gather(asyncio.to_thread(load_existing), fetch_all(payload))
+    existing_df["id"] = existing_df["id"].astype("string")
+    existing_df = existing_df.drop_duplicates("id", keep="last")
+    old_active_mask = normalize_bools(existing_df["is_active"])
+
+    api_df = normalize_courses(raw, now)
+    api_df = api_df.drop_duplicates("id", keep="last")
+
+    # one membership pass over the old ids and one id -> was_active lookup classify everything
+    in_api = existing_df["id"].isin(api_df["id"]).to_numpy()
+    expired_mask = old_active_mask.to_numpy() & ~in_api
+    existing_df.loc[expired_mask, ["is_active", "changed_at", "updated_at"]] = [False, now, now]
+    prev = existing_df.set_index("id")
+
+    was_active = api_df["id"].map(old_active_mask.set_axis(prev.index))
+    new_mask = was_active.isna()
+    revived_mask = was_active.eq(False)
+    still_active = was_active.eq(True)
+    api_df.loc[still_active, "changed_at"] = api_df.loc[still_active, "id"].map(prev["changed_at"])
+
+    new = api_df[new_mask].to_dict("records")
+    revived = api_df[revived_mask].to_dict("records")
+    expired = existing_df[expired_mask].to_dict("records")
+
+    # existing rows keep their position (replaced by fresh api rows), new rows go last
+    api_by_id = api_df.set_index("id")
+    order = prev.index.append(api_by_id.index[new_mask.to_numpy()])
+    final_df = pd.concat([prev[~in_api], api_by_id]).loc[order].rename_axis("id").reset_index()
+    await asyncio.to_thread(save_all, final_df[COLUMNS], new, expired, revived)
     print(f"✨ New: {len(new)}, ⏸️ Expired: {len(expired)}, ♻️ Revived: {len(revived)}")
 
 # ---------------- FILTER DATA ----------------
+@lru_cache(maxsize=None)
+def load_filter_file(name):
+    with open(f"filterparam-data/{name}.json", "rb") as f:
+        return orjson.loads(f.read())
+
 def load_filter_data():
-    with open("filterparam-data/places.json", encoding="utf-8") as f: places = json.load(f)
-    with open("filterparam-data/departments.json", encoding="utf-8") as f: departments = json.load(f)
-    with open("filterparam-data/groups.json", encoding="utf-8") as f: groups = json.load(f)
-    with open("filterparam-data/courses.json", encoding="utf-8") as f: courses = json.load(f)
-    with open("filterparam-data/months.json", encoding="utf-8") as f: months = json.load(f)
-    return places, departments, groups, courses, months
+    return tuple(load_filter_file(name) for name in ("places", "departments", "groups", "courses", "months"))
 
 def multi_select(options, label="title"):
     if not options: return []